@@ -0,0 +1,52 @@
+from collections import Counter, defaultdict
+
+import parasail
+
+KMER_SIZE = 12
+
+
+# function to score a query against a chunk of database sequences
+def score_chunk(query, subjects, scoring):
+    '''Local alignment of query against each subject, returns (index, matches) of the subject with the most identical bases in the chunk'''
+
+    # scoring is (match, mismatch, gap open, gap extend), parasail takes the gap penalties as positive costs
+    match_score, mismatch_score, gap_open_penalty, gap_extend_penalty = scoring
+    scoring_matrix = parasail.matrix_create("ACGT", match_score, mismatch_score)
+    # scan kernels match plain Smith-Waterman exactly, the striped ones drift when gap open equals gap extend
+    query_profile = parasail.profile_create_16(query, scoring_matrix)
+
+    best_idx = None
+    best_matches = 0
+    for idx, subject in enumerate(subjects):
+        # the match percentage is matches over the query length, so the most matches is the best match
+        alignment = parasail.sw_trace_scan_profile_16(query_profile, subject, -gap_open_penalty, -gap_extend_penalty)
+        matches = alignment.traceback.comp.count('|')
+        if matches > best_matches:
+            best_matches = matches
+            best_idx = idx
+            # every query base matched, no later subject can do better
+            if best_matches >= len(query):
+                break
+
+    return best_idx, best_matches
+
+
+# functions for the k-mer prefilter run before alignment
+def kmer_set(seq, k=KMER_SIZE):
+    '''Returns the set of overlapping k-mers in seq'''
+    return frozenset(seq[i:i + k] for i in range(len(seq) - k + 1))
+
+def kmer_index(subject_kmer_sets):
+    '''Maps each k-mer to the indices of the subjects containing it'''
+    index = defaultdict(list)
+    for idx, kmers in enumerate(subject_kmer_sets):
+        for kmer in kmers:
+            index[kmer].append(idx)
+    return dict(index)
+
+def shared_kmer_counts(query_kmers, index):
+    '''Number of query k-mers found in each subject, only subjects sharing at least one are returned'''
+    counts = Counter()
+    for kmer in query_kmers:
+        counts.update(index.get(kmer, ()))
+    return counts
@@ -1,30 +1,66 @@
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
 import pandas as pd
-from Bio import pairwise2
-from Bio.Align import PairwiseAligner
 import streamlit as st
 
+from alignment import kmer_index, kmer_set, score_chunk, shared_kmer_counts
+
 st.title("🧬 DNA Sequence Alignment and Cancer Risk Assesment 🧬")
 
 input_DNA_sequence = st.text_area("Please enter your DNA sequence: ")
 DNA_sequence_1 = input_DNA_sequence.replace("\n", "").replace("\r", "")
 
 
-database = pd.read_csv("cancer_genes.csv")
+# load and cache the database across reruns
+@st.cache_data
+def load_db(path):
+    database = pd.read_parquet(path, engine="pyarrow")
+# keep only the bases, some rows contain line breaks, spaces or a "... (truncated for display)" note
+    database["DNA_seq"] = database["DNA_seq"].astype(str).str.replace("... (truncated for display)", "", regex=False).str.upper().str.replace(r"[^ACGT]", "", regex=True)
+# ascii-encode sequences once, parasail aligns bytes without re-encoding them
+    database["DNA_bytes"] = database["DNA_seq"].map(lambda seq: seq.encode("ascii"))
+# repeated sequences score the same as their first copy, so only that copy is aligned
+    database["duplicate_seq"] = database["DNA_bytes"].duplicated()
+    return database
+
+# which database rows contain each k-mer, shared read-only across reruns
+@st.cache_resource
+def load_kmer_index(path):
+    return kmer_index(kmer_set(seq) for seq in load_db(path)["DNA_seq"])
+
+database = load_db("cancer_genes.parquet")
+database_kmer_index = load_kmer_index("cancer_genes.parquet")
 
+# worker pool for the database scan, kept alive across reruns
+n_workers = os.cpu_count() or 1
 
-DNA_chars = set("AaCcGgTt")
-RNA_chars = set("AaCcGgUu")
-AA_chars = set("ARNDCQEGHILKMPSTWYV")
+# forkserver workers start from a clean process, not a fork of the threaded streamlit server
+@st.cache_resource
+def get_executor():
+    return ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("forkserver"))
+
+
+# compiled once, sequences are upper-cased before matching
+DNA_RE = re.compile(r"[ACGT]*")
+# amino acids that are not also RNA bases
+AA_RE = re.compile(r"[RNDQEHILKMPSTWYV]+")
+RNA_RE = re.compile(r"[ACGU]")
 
 #DNA sequence
 def validate_DNA_sequence(seq):
     seq = seq.upper().strip()
-    if all(char in DNA_chars for char in seq):
+    if DNA_RE.fullmatch(seq):
         return seq
-    elif all(char in AA_chars for char in seq) and all(char not in RNA_chars for char in seq):
+    elif AA_RE.fullmatch(seq):
         st.error("❌ An amino acid sequence was entered. Please enter a DNA sequence.")
         return None
-    elif any(char in RNA_chars for char in seq):
+    elif RNA_RE.search(seq):
         st.error("❌ An RNA sequence was entered. Please enter a DNA sequence.")
         return None
     else: 
@@ -41,39 +77,52 @@ if st.button("🔍 Searching for matches"):
         mismatch_score = -1
         gap_open_penalty = -1
         gap_extend_penalty = -1
+        kmer_threshold = 0.1
 
 # Variables to keep track of the best match
         best_match_percentage = 0
-        best_alignment_result = None
         best_gene_name = None
         best_condition = None
         best_risk_chance = None
+        best_matches = 0
+        best_row = None
 
 
-        for idx, row in database.iterrows():
-            DNA_sequence_2 = str(row["DNA_seq"])
-            alignments = pairwise2.align.localms(DNA_sequence_1, DNA_sequence_2, match_score, mismatch_score, gap_open_penalty, gap_extend_penalty)
+# k-mer prefilter, only align rows sharing enough k-mers with the query (all rows if none do)
+        query_kmers = kmer_set(valid_sequence)
+        candidates = []
+        if query_kmers:
+            shared_kmers = shared_kmer_counts(query_kmers, database_kmer_index)
+            candidates = sorted(idx for idx, shared in shared_kmers.items() if shared / len(query_kmers) >= kmer_threshold)
+        candidate_rows = database.iloc[candidates] if candidates else database
+        candidate_rows = candidate_rows[~candidate_rows["duplicate_seq"]]
 
-            if alignments:
-                best_alignment = alignments[0]
-                aligned_seq_1, aligned_seq_2, score, begin, end = best_alignment
-
-#Count the number of matches (identical bases)
-                matches = sum(1 for a, b in zip(aligned_seq_1, aligned_seq_2) if a == b and a != '-')
-                
-# Calculate the alignment length (excluding gaps)
-                alignment_length = sum(1 for char in aligned_seq_1 if char != '-')
-                
-# Calculate the percentage of matches
-                match_percentage = (matches / alignment_length) * 100
+# Align the candidates, split into one chunk of rows per worker (no empty chunks when there are fewer rows than workers)
+        subject_chunks = np.array_split(candidate_rows["DNA_bytes"].to_numpy(), min(n_workers, len(candidate_rows)))
+        scoring = (match_score, mismatch_score, gap_open_penalty, gap_extend_penalty)
+        score_query = partial(score_chunk, valid_sequence, scoring=scoring)
+        subject_lists = [chunk.tolist() for chunk in subject_chunks]
+        try:
+            results = list(get_executor().map(score_query, subject_lists))
+        except BrokenProcessPool:
+# a worker died, start a fresh pool on the next search and score in-process this time
+            get_executor.clear()
+            results = [score_query(subjects) for subjects in subject_lists]
 
 # Update best match
-                if match_percentage > best_match_percentage:
-                    best_match_percentage = match_percentage
-                    best_alignment_result = best_alignment
-                    best_gene_name = row["Gene"]
-                    best_condition = row["condition"]
-                    best_risk_chance = row["Risk"]
+        offset = 0
+        for chunk, (idx, matches) in zip(subject_chunks, results):
+            if matches > best_matches:
+                best_matches = matches
+                best_row = candidate_rows.iloc[offset + idx]
+            offset += len(chunk)
+
+# score_chunk already counted the identical bases of the best row, as a percentage of the whole query
+        if best_row is not None:
+            best_match_percentage = (best_matches / len(valid_sequence)) * 100
+            best_gene_name = best_row["Gene"]
+            best_condition = best_row["condition"]
+            best_risk_chance = best_row["Risk"]
 
     if best_match_percentage >= 90:
         st.success("✅ Match found!")
@@ -4,10 +4,10 @@ import re
 
 import streamlit as st
 
-# load and read datasets
-verified_data = pd.read_csv('verified_data.csv')
-ctft_data = pd.read_csv('counterfeit_data.csv')
-meta_data = pd.read_csv('metadata.csv', encoding='cp1252')
+# element symbol followed by an optional count, compiled once
+ATOM_RE = re.compile(r'([A-Z][a-z]*)(\d*)')
+# whole formula made only of element symbols and counts
+FORMULA_RE = re.compile(r'(?:[A-Z][a-z]*\d*)+')
 
 # function to extract atom counts from molecular formula
 def extract_atoms(formula):
@@ -17,13 +17,34 @@ def extract_atoms(formula):
     if not isinstance(formula, str):
         return {}
     # create dictionary for each atom type
-    atoms = re.findall(r'([A-Z][a-z]*)(\d*)', formula)
+    atoms = ATOM_RE.findall(formula)
     atom_counts = {}
     for atom, count in atoms:
         atom_counts[atom] = atom_counts.get(atom, 0) + (int(count) if count else 1)
 
     return atom_counts
 
+# load and read datasets, cached across reruns
+@st.cache_data
+def load_verified_data(path):
+    verified_df = pd.read_csv(path)
+    # standardize column names
+    verified_df.columns = verified_df.columns.str.strip().str.lower().str.replace(" ", "_")
+    # index by lowercase drug name for name lookups
+    verified_df.index = verified_df['drug_name'].fillna('').astype(str).str.lower().rename(None)
+    # parse each distinct molecular formula once for formula matching
+    atoms_by_formula = {formula: extract_atoms(formula) for formula in verified_df['molecular_formula'].dropna().unique()}
+    verified_df['atom_counts'] = [atoms_by_formula.get(formula, {}) for formula in verified_df['molecular_formula']]
+    return verified_df
+
+@st.cache_data
+def load_data(path, encoding=None):
+    return pd.read_csv(path, encoding=encoding)
+
+verified_data = load_verified_data('verified_data.csv')
+ctft_data = load_data('counterfeit_data.csv')
+meta_data = load_data('metadata.csv', encoding='cp1252')
+
 # function to assign risk level to compound 
 def assign_risk(row):
         if row['active_ingredient_match'] and row['formula_match']: # active ingredients and molecular formula matches
@@ -46,18 +67,18 @@ def assign_risk(row):
 def compare_drug(input_data, known_drugs):
     '''Compares input drug composition with known drugs and applies rule-based scoring, returns a table'''
 
-    # standardize column names
-    verified_data.columns = verified_data.columns.str.strip().str.lower().str.replace(" ", "_")
-
-    # filter for only the matching drug
-    known_drugs = verified_data[verified_data['drug_name'].str.lower() == input_data['drug_name'].lower()].copy()
+    # filter for only the matching drug, verified data is indexed by lowercase name
+    drug_key = input_data['drug_name'].lower()
+    if drug_key in verified_data.index:
+        known_drugs = verified_data.loc[[drug_key]].reset_index(drop=True)
+    else:
+        known_drugs = verified_data.iloc[:0].copy()
 
     if known_drugs.empty:
         print(f"No verified drug data found for: {input_data['drug_name']}")
 
-    # extracting atom counts for comparison
+    # extracting atom counts for comparison, known drugs are parsed at load time
     input_formula_atoms = extract_atoms(input_data['molecular_formula'])
-    known_drugs['input_formula_atoms'] = known_drugs['molecular_formula'].apply(extract_atoms)
 
     # check if active ingredient matches
     known_drugs['active_ingredient_match'] = known_drugs['active_ingredient'] == input_data['active_ingredient']
@@ -67,7 +88,7 @@ def compare_drug(input_data, known_drugs):
     known_drugs['molecular_weight_diff'] = molecular_weight_diff
 
     # check molecular formula match based on atom counts
-    known_drugs['formula_match'] = known_drugs['input_formula_atoms'].apply(lambda x: x == input_formula_atoms)
+    known_drugs['formula_match'] = [atoms == input_formula_atoms for atoms in known_drugs['atom_counts']]
 
     # assign risk level    
     known_drugs['risk'] = known_drugs.apply(assign_risk, axis=1)
@@ -85,66 +106,74 @@ def compare_drug(input_data, known_drugs):
         'formula_match': 'Molecular Formula Match'
     })
 
-    for index, row in result.iterrows():
-        risk_level = row['Risk Level']
-
+    for drug, risk_level in zip(result['Drug Name'], result['Risk Level']):
         if risk_level == 'Low Risk':
-            st.write(f"Drug: {row['Drug Name']} - Risk Level: Low. The drug is most likely genuine.")
+            st.write(f"Drug: {drug} - Risk Level: Low. The drug is most likely genuine.")
         elif risk_level == 'Medium Risk':
-            st.write(f"Drug: {row['Drug Name']} - Risk Level: Medium. There is some variation, and the drug is likely a counterfeit. Please consult a trusted professional for further verification before taking.")
+            st.write(f"Drug: {drug} - Risk Level: Medium. There is some variation, and the drug is likely a counterfeit. Please consult a trusted professional for further verification before taking.")
         else:
-            st.write(f"Drug: {row['Drug Name']} - Risk Level: High, The drug is a counterfeit. Whether it's mislabelling or improper chemical composition, it can be life threatening to ingest counterfeit drugs. Do NOT take.")
+            st.write(f"Drug: {drug} - Risk Level: High, The drug is a counterfeit. Whether it's mislabelling or improper chemical composition, it can be life threatening to ingest counterfeit drugs. Do NOT take.")
     return result
 
 def compare_counterfeit_dataset(ctft_df, verified_df):
-    comparison_results = []
-
-    verified_df['drug_name'] = verified_df['drug_name'].fillna('').astype(str)
     ctft_data['Drug Name'] = ctft_data['Drug Name'].fillna('').astype(str)
 
-    for index, row in ctft_df.iterrows():
-        drug_name = row['Drug Name']
-        verified_row = verified_df[verified_df['drug_name'].str.lower() == drug_name.lower()]
-
-        if verified_row.empty:
-            # if no match found in verified dataset
-            comparison_results.append({
-                'Drug Name': drug_name,
-                'Risk Level': 'Unknown - Drug not found',
-                'Molecular Formula Match': 'N/A',
-                'Molecular Weight Difference (%)': 'N/A',
-                'Active Ingredient Match': 'N/A'
-            })
-            continue
-
-        verified_row = verified_row.iloc[0]
-
-        # check each component
-        formula_match = row['Molecular Formula'] == verified_row['molecular_formula']
-        weight_diff = abs(float(row['Molecular Weight (g/mol)']) - float(verified_row['molecular_weight_(g/mol)'])) / float(verified_row['molecular_weight_(g/mol)']) * 100
-        active_match = set(row['Active Ingredient'].split(', ')) == set(verified_row['active_ingredient'].split(', '))
-
-        # determine risk
-        if active_match and formula_match:
-            if weight_diff <= 0.2:
-                risk = 'Low'
-            elif weight_diff <= 5:
-                risk = 'Medium'
-            else:
-                risk = "High"
-        else:
-            risk = 'High'
+    # match each counterfeit drug to the first verified entry with the same name
+    verified_first = verified_df[~verified_df.index.duplicated()][['molecular_formula', 'active_ingredient', 'molecular_weight_(g/mol)']]
+    merged = ctft_df.assign(drug_name_lower=ctft_df['Drug Name'].str.lower()).merge(verified_first, left_on='drug_name_lower', right_index=True, how='left', indicator=True)
+    found = merged['_merge'] == 'both'
+
+    # check each component
+    formula_match = merged['Molecular Formula'] == merged['molecular_formula']
+    verified_weight = merged['molecular_weight_(g/mol)'].astype(float)
+    weight_diff = (merged['Molecular Weight (g/mol)'].astype(float) - verified_weight).abs() / verified_weight * 100
+    active_match = merged['Active Ingredient'].str.split(', ').map(set, na_action='ignore') == merged['active_ingredient'].str.split(', ').map(set, na_action='ignore')
+
+    # determine risk
+    risk = np.select(
+        [~(active_match & formula_match), weight_diff <= 0.2, weight_diff <= 5],
+        ['High', 'Low', 'Medium'],
+        default='High'
+    )
 
-        # Append result
-        comparison_results.append({
-            'Drug Name': drug_name,
-            'Risk Level': risk,
-            'Molecular Formula Match': formula_match,
-            'Molecular Weight Difference (%)': round(weight_diff, 2),
-            'Active Ingredient Match': active_match
-        })
+    # build results, drugs not found in the verified dataset get N/A
+    return pd.DataFrame({
+        'Drug Name': merged['Drug Name'],
+        'Risk Level': np.where(found, risk, 'Unknown - Drug not found'),
+        'Molecular Formula Match': formula_match.where(found, 'N/A'),
+        'Molecular Weight Difference (%)': weight_diff.round(2).where(found, 'N/A'),
+        'Active Ingredient Match': active_match.where(found, 'N/A')
+    })
 
-    return pd.DataFrame(comparison_results)
+# function to validate a new drug before it is added to the verified dataset
+def validate_new_drug(name, active_ingredient, formula, weight):
+    '''Checks the new drug fields, returns a row for the verified dataset or None after showing an error'''
+
+    name, active_ingredient, formula, weight = name.strip(), active_ingredient.strip(), formula.strip(), weight.strip()
+
+    # every field is required
+    if not (name and active_ingredient and formula and weight):
+        st.error("❌ Please fill in every field before adding the drug.")
+        return None
+    # formula must be element symbols followed by optional counts
+    if not FORMULA_RE.fullmatch(formula):
+        st.error(f"❌ '{formula}' is not a valid molecular formula. Please enter element symbols and counts only, e.g. C9H8O4.")
+        return None
+    # weight must be a positive number
+    try:
+        molecular_weight = float(weight)
+    except ValueError:
+        molecular_weight = None
+    if molecular_weight is None or not np.isfinite(molecular_weight) or molecular_weight <= 0:
+        st.error(f"❌ '{weight}' is not a valid molecular weight. Please enter a positive number of grams/mole, e.g. 180.16.")
+        return None
+
+    return {
+        'Drug Name': name,
+        'Active Ingredient': active_ingredient,
+        'Molecular Formula': formula,
+        'Molecular Weight (g/mol)': molecular_weight
+    }
 
 # Streamlit UI
 st.title("Counterfeit Medicine Finder: Drug Composition Comparison Tool")
@@ -202,23 +231,36 @@ with st.expander(f'Find a drug you think is counterfeit?'):
 
 # manual input of newly approved drugs
 with st.expander(f'Are you a healthcare professional? Enter details about a new drug to our database to help prevent counterfeits.'):
-    new_drug_name = st.text_input("Enter the name of the newly approved drug: ")
-    new_active_ingredient = st.text_input("Enter its active ingredient (all lowercase): ")
-    new_molecular_formula = st.text_input("Enter the molecular formula of the active ingredient: ")
-    new_molecular_weight = st.text_input("Enter the molecular weight of the active ingredient (g/mol): ")
-
-    # append new drug
-    if new_drug_name and new_molecular_weight and new_active_ingredient and new_molecular_formula:
-        new_row = pd.DataFrame([{
-            'Drug Name': new_drug_name,
-            'Active Ingredient': new_active_ingredient,
-            'Molecular Formula': new_molecular_formula,
-            'Molecular Weight (g/mol)': new_molecular_weight
-        }])
-
-        verified_data = pd.concat([verified_data, new_row])
-
-        st.write("New drug added successfully!")
+    # the form is cleared after each submission so a drug is only queued once
+    with st.form('new_drug_form', clear_on_submit=True):
+        new_drug_name = st.text_input("Enter the name of the newly approved drug: ")
+        new_active_ingredient = st.text_input("Enter its active ingredient (all lowercase): ")
+        new_molecular_formula = st.text_input("Enter the molecular formula of the active ingredient: ")
+        new_molecular_weight = st.text_input("Enter the molecular weight of the active ingredient (g/mol): ")
+        add_drug = st.form_submit_button("Add drug")
+
+    # buffer new drugs for this session, they are written to the dataset in one batch
+    if 'pending_drugs' not in st.session_state:
+        st.session_state.pending_drugs = []
+
+    # only validated entries are queued, so nothing malformed reaches the dataset
+    if add_drug:
+        new_drug = validate_new_drug(new_drug_name, new_active_ingredient, new_molecular_formula, new_molecular_weight)
+        if new_drug is not None:
+            st.session_state.pending_drugs.append(new_drug)
+
+            st.write("New drug added successfully!")
+
+    # append pending drugs to the verified dataset and reload it on the next run
+    if st.session_state.pending_drugs:
+        st.write(f"{len(st.session_state.pending_drugs)} new drug(s) waiting to be saved to the database.")
+
+        if st.button("Save new drugs"):
+            pd.DataFrame(st.session_state.pending_drugs).to_csv('verified_data.csv', mode='a', header=False, index=False, lineterminator='\r\n')
+            st.session_state.pending_drugs.clear()
+            load_verified_data.clear()
+
+            st.write("New drugs saved to the database!")
 
 
 # comparing counterfeit data set to verified data set